@@ -2,15 +2,26 @@ import ipaddress
 import json
 import logging
 import os
+import queue
 import re
+import selectors
 import signal
 import socket
 import sys
 import threading
 import time
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from prometheus_client import Counter, Gauge, generate_latest, CONTENT_TYPE_LATEST, REGISTRY
-from cachetools import TTLCache
+
+# Optional faster JSON parser for loading large subnet files
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
 
 # --- Prometheus Metrics ---
 # Use a function to get or create metrics to avoid re-registration errors during testing
@@ -34,6 +45,22 @@ http_requests_total = _get_or_create_counter(
     ['method', 'path', 'status']
 )
 
+# Label-bound children for the fixed request paths, resolved once at import
+_H_HEALTHZ_200 = http_requests_total.labels('GET', '/healthz', '200')
+_H_READYZ_200 = http_requests_total.labels('GET', '/readyz', '200')
+_H_METRICS_200 = http_requests_total.labels('GET', '/metrics', '200')
+_H_CACHE_STATS_200 = http_requests_total.labels('GET', '/cache/stats', '200')
+_H_CACHE_RESET_200 = http_requests_total.labels('GET', '/cache/reset', '200')
+_H_IP_200 = http_requests_total.labels('GET', '/ip', '200')
+_H_IP_400 = http_requests_total.labels('GET', '/ip', '400')
+_H_IP_404 = http_requests_total.labels('GET', '/ip', '404')
+_H_IP_500 = http_requests_total.labels('GET', '/ip', '500')
+_H_ROOT_404 = http_requests_total.labels('GET', '/', '404')
+_H_FQDN_200 = http_requests_total.labels('GET', '/fqdn', '200')
+_H_FQDN_400 = http_requests_total.labels('GET', '/fqdn', '400')
+_H_FQDN_404 = http_requests_total.labels('GET', '/fqdn', '404')
+_H_FQDN_500 = http_requests_total.labels('GET', '/fqdn', '500')
+
 dns_lookups_total = _get_or_create_counter(
     'dns_lookups_total',
     'Total number of DNS lookups performed'
@@ -74,6 +101,35 @@ dns_cache_size = _get_or_create_gauge(
     'Current number of entries in DNS cache'
 )
 
+
+@dataclass
+class _MetricsBatch:
+    """Counter deltas collected during a request and flushed to Prometheus once."""
+    dns_lookups: int = 0
+    dns_lookups_success: int = 0
+    dns_lookups_failure: int = 0
+    dns_cache_hits: int = 0
+    dns_cache_misses: int = 0
+    zone_lookups_success: int = 0
+    zone_lookups_failure: int = 0
+
+    def flush(self):
+        """Increments the Prometheus counters by the non-zero deltas."""
+        if self.dns_lookups:
+            dns_lookups_total.inc(self.dns_lookups)
+        if self.dns_lookups_success:
+            dns_lookups_success_total.inc(self.dns_lookups_success)
+        if self.dns_lookups_failure:
+            dns_lookups_failure_total.inc(self.dns_lookups_failure)
+        if self.dns_cache_hits:
+            dns_cache_hits_total.inc(self.dns_cache_hits)
+        if self.dns_cache_misses:
+            dns_cache_misses_total.inc(self.dns_cache_misses)
+        if self.zone_lookups_success:
+            zone_lookups_success_total.inc(self.zone_lookups_success)
+        if self.zone_lookups_failure:
+            zone_lookups_failure_total.inc(self.zone_lookups_failure)
+
 # --- Configuration ---
 # Configure logging to output to stdout
 log_level = os.environ.get('LOG_LEVEL', 'INFO').upper()
@@ -88,77 +144,118 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s',
     stream=sys.stdout
 )
+log = logging.getLogger(__name__)
 
 # --- DNS Cache ---
 class DNSCache:
-    """Thread-safe DNS cache with TTL support using cachetools.TTLCache."""
+    """Thread-safe LRU DNS cache with per-entry TTL based on monotonic expiry.
+
+    Resolved FQDNs map to their IP address. FQDNs that failed to resolve map
+    to the (errno, strerror) args of the failure, in a separate smaller map so
+    that a stream of missing names cannot evict resolved entries.
+    """
     
-    def __init__(self, maxsize=1000, ttl=300):
-        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
-        self.lock = threading.RLock()
+    def __init__(self, maxsize=1000, ttl=300, negative_maxsize=100):
+        # {fqdn: (ip_address, expiry_monotonic)}, ordered from least to most recently used
+        self.cache = OrderedDict()
+        # {fqdn: ((errno, strerror), expiry_monotonic)}, ordered the same way
+        self.negative_cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.maxsize = maxsize
+        self.negative_maxsize = negative_maxsize
         self.ttl = ttl
         self.default_ttl = ttl  # For backward compatibility with tests
-        # Track custom TTLs for individual entries
-        self._custom_ttls = {}  # {fqdn: (expiry_time)}
-        logging.info(f"DNS cache initialized with TTL: {ttl} seconds, max size: {maxsize}")
+        log.info("DNS cache initialized with TTL: %s seconds, max size: %s", ttl, maxsize)
     
-    def get(self, fqdn):
-        """Get cached IP for FQDN if not expired."""
+    def get(self, fqdn, metrics):
+        """Get cached IP or failure args for FQDN if not expired, counting the hit or miss in metrics."""
+        now = time.monotonic()
         with self.lock:
-            # Check custom TTL first
-            if fqdn in self._custom_ttls:
-                expiry_time = self._custom_ttls[fqdn]
-                if time.time() >= expiry_time:
-                    # Custom TTL expired, remove from both caches
-                    self._custom_ttls.pop(fqdn, None)
-                    self.cache.pop(fqdn, None)
-                    dns_cache_misses_total.inc()
-                    return None
-            
-            ip_address = self.cache.get(fqdn)
-            if ip_address is not None:
-                logging.debug(f"DNS cache hit for {fqdn}: {ip_address}")
-                dns_cache_hits_total.inc()
-                return ip_address
-        dns_cache_misses_total.inc()
-        return None
+            value = self._get_live(self.cache, fqdn, now)
+            if value is None:
+                value = self._get_live(self.negative_cache, fqdn, now)
+        if value is None:
+            metrics.dns_cache_misses += 1
+            return None
+        log.debug("DNS cache hit for %s: %s", fqdn, value)
+        metrics.dns_cache_hits += 1
+        return value
+
+    @staticmethod
+    def _get_live(entries, fqdn, now):
+        """Returns the unexpired value for fqdn, marking it most recently used."""
+        entry = entries.get(fqdn)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del entries[fqdn]
+            return None
+        entries.move_to_end(fqdn)
+        return entry[0]
     
     def set(self, fqdn, ip_address, ttl=None):
         """Cache IP address for FQDN with TTL."""
+        if ttl is None:
+            ttl = self.ttl
+        entry = (ip_address, time.monotonic() + ttl)
         with self.lock:
-            self.cache[fqdn] = ip_address
-            
-            # Track custom TTL if specified
-            if ttl is not None and ttl != self.ttl:
-                self._custom_ttls[fqdn] = time.time() + ttl
-            else:
-                # Remove custom TTL tracking if using default
-                self._custom_ttls.pop(fqdn, None)
-            
-            logging.debug(f"DNS cached {fqdn} -> {ip_address} (TTL: {ttl if ttl is not None else self.ttl}s)")
-            dns_cache_size.set(len(self.cache))
+            self.negative_cache.pop(fqdn, None)
+            self._store(self.cache, fqdn, entry, self.maxsize)
+        log.debug("DNS cached %s -> %s (TTL: %ss)", fqdn, ip_address, ttl)
+
+    def set_negative(self, fqdn, error_args, ttl):
+        """Cache the (errno, strerror) args of a failed lookup for FQDN with TTL."""
+        entry = (error_args, time.monotonic() + ttl)
+        with self.lock:
+            self.cache.pop(fqdn, None)
+            self._store(self.negative_cache, fqdn, entry, self.negative_maxsize)
+        log.debug("DNS negatively cached %s (TTL: %ss)", fqdn, ttl)
+
+    @staticmethod
+    def _store(entries, fqdn, entry, maxsize):
+        """Stores the entry as most recently used, evicting the least recently used beyond maxsize."""
+        entries[fqdn] = entry
+        entries.move_to_end(fqdn)
+        while len(entries) > maxsize:
+            entries.popitem(last=False)
 
     def reset(self):
         """Clear the entire cache."""
         with self.lock:
             self.cache.clear()
-            self._custom_ttls.clear()
-            dns_cache_size.set(0)
-            logging.info("DNS cache has been reset.")
+            self.negative_cache.clear()
+        log.info("DNS cache has been reset.")
     
+    def __len__(self):
+        """Return the number of unexpired resolved entries, as reported in stats()."""
+        now = time.monotonic()
+        with self.lock:
+            return sum(1 for _, expiry in self.cache.values() if expiry > now)
+
     def stats(self):
-        """Return cache statistics."""
+        """Return cache statistics, dropping expired entries first."""
+        now = time.monotonic()
         with self.lock:
+            for entries in (self.cache, self.negative_cache):
+                for fqdn in [fqdn for fqdn, entry in entries.items() if entry[1] <= now]:
+                    del entries[fqdn]
             return {
                 'total_entries': len(self.cache),
-                'entries': list(self.cache.keys()),
-                'maxsize': self.cache.maxsize
+                'entries': list(self.cache),
+                'negative_entries': list(self.negative_cache),
+                'maxsize': self.maxsize
             }
 
 # Initialize DNS cache with configurable TTL (default 5 minutes) and max size
 DNS_CACHE_TTL = int(os.environ.get('DNS_CACHE_TTL', '300'))
 DNS_CACHE_MAXSIZE = int(os.environ.get('DNS_CACHE_MAXSIZE', '1000'))
-dns_cache = DNSCache(maxsize=DNS_CACHE_MAXSIZE, ttl=DNS_CACHE_TTL)
+# TTL for unresolvable FQDNs, so repeated lookups of a missing name skip DNS (0 disables)
+DNS_NEGATIVE_CACHE_TTL = int(os.environ.get('DNS_NEGATIVE_CACHE_TTL', '30'))
+# Separate cap for unresolvable FQDNs, so they cannot evict resolved entries
+DNS_NEGATIVE_CACHE_MAXSIZE = int(os.environ.get('DNS_NEGATIVE_CACHE_MAXSIZE', '100'))
+dns_cache = DNSCache(maxsize=DNS_CACHE_MAXSIZE, ttl=DNS_CACHE_TTL, negative_maxsize=DNS_NEGATIVE_CACHE_MAXSIZE)
+# Read the cache size when metrics are collected instead of on every change
+dns_cache_size.set_function(dns_cache.__len__)
 
 def load_subnets_data():
     """Load subnet data from external JSON file."""
@@ -167,15 +264,15 @@ def load_subnets_data():
     
     if os.path.exists(subnets_file):
         try:
-            with open(subnets_file, 'r') as f:
-                subnets_data = json.load(f)
-            logging.info(f"Loaded subnet data from {subnets_file}")
+            with open(subnets_file, 'rb') as f:
+                subnets_data = _json_loads(f.read())
+            log.info("Loaded subnet data from %s", subnets_file)
             return subnets_data
         except (json.JSONDecodeError, IOError) as e:
-            logging.error(f"Failed to load subnet data from {subnets_file}: {e}.")
+            log.error("Failed to load subnet data from %s: %s.", subnets_file, e)
             sys.exit(1)
     else:
-        logging.info(f"Subnet file {subnets_file} not found.")
+        log.info("Subnet file %s not found.", subnets_file)
         sys.exit(1)
 
 SUBNETS_DATA = load_subnets_data()
@@ -187,140 +284,251 @@ try:
             "AvailabilityZoneId": subnet["AvailabilityZoneId"]
         } for subnet in SUBNETS_DATA
     }
-    logging.info(f"Successfully loaded {len(CIDR_MAPPINGS)} subnet mappings.")
+    log.info("Successfully loaded %s subnet mappings.", len(CIDR_MAPPINGS))
 except KeyError as e:
-    logging.critical(f"Failed to load or parse subnet information: {e}")
+    log.critical("Failed to load or parse subnet information: %s", e)
     sys.exit(1)
 
 
+# --- Subnet Lookup Tables ---
+# Trie nodes are [zero_child, one_child, zone_data] lists; a node carries
+# zone_data when a subnet ends at that depth.
+def _build_cidr_tries(cidr_mappings):
+    """Builds binary prefix tries (keyed by IP version) from the CIDR mappings."""
+    tries = {4: [None, None, None], 6: [None, None, None]}
+    for network, data in cidr_mappings.items():
+        node = tries[network.version]
+        network_int = int(network.network_address)
+        for shift in range(network.max_prefixlen - 1, network.max_prefixlen - 1 - network.prefixlen, -1):
+            bit = (network_int >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        node[2] = data
+    return tries
+
+
+def _lookup_cidr_trie(trie, ip_int, max_prefixlen):
+    """Returns the zone data of the longest prefix in the trie matching ip_int."""
+    node = trie
+    match = node[2]
+    for shift in range(max_prefixlen - 1, -1, -1):
+        node = node[(ip_int >> shift) & 1]
+        if node is None:
+            break
+        if node[2] is not None:
+            match = node[2]
+    return match
+
+
+def _build_cidr_ranges(cidr_mappings):
+    """Flattens the CIDR mappings into sorted, disjoint address ranges per IP version.
+
+    Returns {version: (starts, zone_data)}, where the range beginning at
+    starts[i] maps to zone_data[i] (None for gaps between subnets).
+    """
+    # Local, so the trie is freed once the ranges are built
+    tries = _build_cidr_tries(cidr_mappings)
+    boundaries = {4: set(), 6: set()}
+    for network in cidr_mappings:
+        boundaries[network.version].add(int(network.network_address))
+        boundaries[network.version].add(int(network.broadcast_address) + 1)
+
+    ranges = {}
+    for version, max_prefixlen in ((4, 32), (6, 128)):
+        starts, zone_data = [], []
+        for start in sorted(boundaries[version]):
+            # No subnet boundary falls inside a range, so its first address decides the match
+            data = _lookup_cidr_trie(tries[version], start, max_prefixlen) if start < 1 << max_prefixlen else None
+            if zone_data and zone_data[-1] is data:
+                continue
+            starts.append(start)
+            zone_data.append(data)
+        ranges[version] = (starts, zone_data)
+    return ranges
+
+
+def _make_range_lookup(starts, zone_data):
+    """Returns a function mapping an integer address to its range's zone data."""
+    def lookup(ip_int, _bisect=bisect_right, _starts=starts, _zone_data=zone_data):
+        index = _bisect(_starts, ip_int) - 1
+        return _zone_data[index] if index >= 0 else None
+    return lookup
+
+
+def _ip_to_int(ip_address_str):
+    """Converts an IP address string to a (version, integer) tuple."""
+    if ':' in ip_address_str:
+        version, family = 6, socket.AF_INET6
+    else:
+        version, family = 4, socket.AF_INET
+    try:
+        return version, int.from_bytes(socket.inet_pton(family, ip_address_str), 'big')
+    except OSError:
+        # Fall back to ipaddress for forms inet_pton rejects (e.g. scoped IPv6)
+        ip = ipaddress.ip_address(ip_address_str)
+        return ip.version, int(ip)
+
+
+CIDR_LOOKUPS = {version: _make_range_lookup(*ranges) for version, ranges in _build_cidr_ranges(CIDR_MAPPINGS).items()}
+
+
 # --- HTTP Handler ---
+# Fixed response bodies, encoded once instead of on every request
+_HEALTHY_BODY = json.dumps({'status': 'ok'}).encode('utf-8')
+_CACHE_RESET_BODY = json.dumps({'status': 'cache reseted'}).encode('utf-8')
+
+
+@lru_cache(maxsize=64)
+def _error_body(message):
+    """Returns the encoded JSON error body, memoized since error messages are fixed strings."""
+    return json.dumps({'error': message}).encode('utf-8')
+
+
 class RequestHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests (all responses set Content-Length)
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate sends; TCP_NODELAY stops the body waiting on a delayed ACK
+    disable_nagle_algorithm = True
+    # Socket timeout, and how long an idle keep-alive connection is kept open
+    timeout = 60
+
+    # Fixed endpoints by exact path: (response method name, request counter)
+    _FIXED_ROUTES = {
+        '/healthz': ('send_healthy_response', _H_HEALTHZ_200),
+        '/readyz': ('send_healthy_response', _H_READYZ_200),
+        '/metrics': ('send_metrics_response', _H_METRICS_200),
+        '/cache/stats': ('send_cache_stats', _H_CACHE_STATS_200),
+        '/cache/reset': ('reset_cache', _H_CACHE_RESET_200),
+    }
+
     def do_GET(self):
         """Handles GET requests."""
-        if self.path in ('/healthz', '/readyz'):
-            self.send_healthy_response()
-            http_requests_total.labels(method='GET', path=self.path, status='200').inc()
-            return
-        
-        if self.path == '/metrics':
-            self.send_metrics_response()
-            http_requests_total.labels(method='GET', path='/metrics', status='200').inc()
-            return
-        
-        if self.path == '/cache/stats':
-            self.send_cache_stats()
-            http_requests_total.labels(method='GET', path='/cache/stats', status='200').inc()
-            return
-        
-        if self.path == '/cache/reset':
-            self.reset_cache()
-            http_requests_total.labels(method='GET', path='/cache/reset', status='200').inc()
+        metrics = _MetricsBatch()
+        try:
+            self._handle_get(metrics)
+        finally:
+            metrics.flush()
+
+    def _handle_get(self, metrics):
+        """Routes a GET request, recording counter deltas in the metrics batch."""
+        path = self.path
+        route = self._FIXED_ROUTES.get(path)
+        if route is not None:
+            method_name, requests_counter = route
+            getattr(self, method_name)()
+            requests_counter.inc()
             return
 
-        if not self.path.startswith('/'):
+        if not path.startswith('/'):
             self.send_error_response(400, "Invalid path")
-            http_requests_total.labels(method='GET', path=self.path, status='400').inc()
+            http_requests_total.labels(method='GET', path=path, status='400').inc()
             return
         
         # Handle direct IP lookup
-        if self.path.startswith('/ip/'):
-            ip_address = self.path[len('/ip/'):]
+        if path.startswith('/ip/'):
+            ip_address = path[len('/ip/'):]
             if not ip_address:
                 self.send_error_response(404, "Not Found. Please provide an IP address in the path, e.g., /ip/192.168.0.1")
-                http_requests_total.labels(method='GET', path='/ip', status='404').inc()
+                _H_IP_404.inc()
                 return
             
-            logging.info(f"Received lookup request for IP: {ip_address}")
+            log.info("Received lookup request for IP: %s", ip_address)
             try:
                 # Validate IP format
                 ipaddress.ip_address(ip_address)
                 
                 zone_data = self._get_zone_data(ip_address)
                 if zone_data:
-                    logging.info(f"Found matching zone data for IP {ip_address}, zone: {zone_data['AvailabilityZone']}, zoneId: {zone_data['AvailabilityZoneId']}")
-                    zone_lookups_success_total.inc()
+                    log.info("Found matching zone data for IP %s, zone: %s, zoneId: %s", ip_address, zone_data['AvailabilityZone'], zone_data['AvailabilityZoneId'])
+                    metrics.zone_lookups_success += 1
                     self.send_json_response(200, {
                         'zone': zone_data['AvailabilityZone'],
                         'zoneId': zone_data['AvailabilityZoneId']
                     })
-                    http_requests_total.labels(method='GET', path='/ip', status='200').inc()
+                    _H_IP_200.inc()
                 else:
-                    logging.warning(f"No matching zone found for IP {ip_address}")
-                    zone_lookups_failure_total.inc()
+                    log.warning("No matching zone found for IP %s", ip_address)
+                    metrics.zone_lookups_failure += 1
                     self.send_error_response(404, "Zone not found for the given IP")
-                    http_requests_total.labels(method='GET', path='/ip', status='404').inc()
+                    _H_IP_404.inc()
             except ValueError:
-                logging.warning(f"Invalid IP address format: {ip_address}")
+                log.warning("Invalid IP address format: %s", ip_address)
                 self.send_error_response(400, "Invalid IP address format")
-                http_requests_total.labels(method='GET', path='/ip', status='400').inc()
+                _H_IP_400.inc()
             except Exception as e:
-                logging.critical(f"An unexpected error occurred for IP {ip_address}: {e}", exc_info=True)
+                log.critical("An unexpected error occurred for IP %s: %s", ip_address, e, exc_info=True)
                 self.send_error_response(500, "Internal Server Error")
-                http_requests_total.labels(method='GET', path='/ip', status='500').inc()
+                _H_IP_500.inc()
             return
 
         # Extract FQDN from path
-        if not self.path.startswith('/fqdn/'):
+        if not path.startswith('/fqdn/'):
             self.send_error_response(404, "Not Found. Please use /fqdn/<hostname> or /ip/<ip_address>")
-            http_requests_total.labels(method='GET', path=self.path, status='404').inc()
+            http_requests_total.labels(method='GET', path=path, status='404').inc()
             return
         
-        fqdn = self.path[len('/fqdn/'):]
+        fqdn = path[len('/fqdn/'):]
 
         if not fqdn:
             self.send_error_response(404, "Not Found. Please provide a FQDN in the path, e.g., /fqdn/my.database.com")
-            http_requests_total.labels(method='GET', path='/', status='404').inc()
+            _H_ROOT_404.inc()
             return
 
         # Validate FQDN format
         if not self._is_valid_fqdn(fqdn):
-            logging.warning(f"Invalid FQDN format: {fqdn}")
+            log.warning("Invalid FQDN format: %s", fqdn)
             self.send_error_response(400, "Invalid FQDN format")
-            http_requests_total.labels(method='GET', path='/fqdn', status='400').inc()
+            _H_FQDN_400.inc()
             return
 
-        logging.info(f"Received lookup request for FQDN: {fqdn}")
+        log.info("Received lookup request for FQDN: %s", fqdn)
         try:
-            ip_address = self._get_ip_address(fqdn)
-            logging.info(f"Resolved {fqdn} to IP address: {ip_address}")
+            ip_address = self._get_ip_address(fqdn, metrics)
+            log.info("Resolved %s to IP address: %s", fqdn, ip_address)
 
             zone_data = self._get_zone_data(ip_address)
             if zone_data:
-                logging.info(f"Found matching zone data for IP {ip_address}, zone: {zone_data['AvailabilityZone']}, zoneId: {zone_data['AvailabilityZoneId']}")
-                zone_lookups_success_total.inc()
+                log.info("Found matching zone data for IP %s, zone: %s, zoneId: %s", ip_address, zone_data['AvailabilityZone'], zone_data['AvailabilityZoneId'])
+                metrics.zone_lookups_success += 1
                 self.send_json_response(200, {
                     'zone': zone_data['AvailabilityZone'],
                     'zoneId': zone_data['AvailabilityZoneId']
                 })
-                http_requests_total.labels(method='GET', path='/fqdn', status='200').inc()
+                _H_FQDN_200.inc()
             else:
-                logging.warning(f"No matching zone found for IP {ip_address}")
-                zone_lookups_failure_total.inc()
+                log.warning("No matching zone found for IP %s", ip_address)
+                metrics.zone_lookups_failure += 1
                 self.send_error_response(404, "Zone not found for the given FQDN's IP")
-                http_requests_total.labels(method='GET', path='/fqdn', status='404').inc()
+                _H_FQDN_404.inc()
         except socket.gaierror:
-            logging.error(f"DNS lookup failed for FQDN: {fqdn}")
+            log.error("DNS lookup failed for FQDN: %s", fqdn)
             self.send_error_response(404, "FQDN not found or could not be resolved")
-            http_requests_total.labels(method='GET', path='/fqdn', status='404').inc()
+            _H_FQDN_404.inc()
         except Exception as e:
-            logging.critical(f"An unexpected error occurred for FQDN {fqdn}: {e}", exc_info=True)
+            log.critical("An unexpected error occurred for FQDN %s: %s", fqdn, e, exc_info=True)
             self.send_error_response(500, "Internal Server Error")
-            http_requests_total.labels(method='GET', path='/fqdn', status='500').inc()
+            _H_FQDN_500.inc()
 
-    def send_json_response(self, status_code, payload):
-        """Sends a JSON response."""
+    def send_body(self, status_code, body, content_type='application/json'):
+        """Sends an already encoded response body."""
         self.send_response(status_code)
-        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(json.dumps(payload).encode('utf-8'))
+        self.wfile.write(body)
+
+    def send_json_response(self, status_code, payload):
+        """Sends a JSON response."""
+        self.send_body(status_code, json.dumps(payload).encode('utf-8'))
 
     def send_error_response(self, status_code, message):
         """Sends a JSON error response."""
-        self.send_json_response(status_code, {'error': message})
+        self.send_body(status_code, _error_body(message))
 
     def send_healthy_response(self):
         """Sends a health check response."""
-        self.send_json_response(200, {'status': 'ok'})
+        self.send_body(200, _HEALTHY_BODY)
     
     def send_cache_stats(self):
         """Sends DNS cache statistics."""
@@ -331,19 +539,16 @@ class RequestHandler(BaseHTTPRequestHandler):
     def reset_cache(self):
         """Resets DNS cache statistics."""
         dns_cache.reset()
-        self.send_json_response(200, {'status': 'cache reseted'})
+        self.send_body(200, _CACHE_RESET_BODY)
 
     def send_metrics_response(self):
         """Sends Prometheus metrics."""
-        metrics_output = generate_latest()
-        self.send_response(200)
-        self.send_header('Content-type', CONTENT_TYPE_LATEST)
-        self.end_headers()
-        self.wfile.write(metrics_output)
+        self.send_body(200, generate_latest(), CONTENT_TYPE_LATEST)
 
     def log_message(self, format, *args):
         """Override default logging to use our configured logger, not stderr."""
-        logging.info("%s - %s" % (self.address_string(), format % args))
+        if log.isEnabledFor(logging.INFO):
+            log.info("%s - " + format, self.address_string(), *args)
 
     def log_request(self, code='-', size='-'):
         """Override log_request to handle missing requestline attribute."""
@@ -354,33 +559,39 @@ class RequestHandler(BaseHTTPRequestHandler):
             self.log_message('%s %s', str(code), str(size))
 
     @staticmethod
-    def _get_ip_address(fqdn):
-        """Resolves an FQDN to an IP address with caching."""
-
+    def _get_ip_address(fqdn, metrics):
+        """Resolves an FQDN to an IP address with caching, counting lookups in metrics."""
         # Check cache first
-        ip_address = dns_cache.get(fqdn)
+        ip_address = dns_cache.get(fqdn, metrics)
+        if isinstance(ip_address, tuple):
+            log.debug("Resolved lookup request for FQDN from negative cache: %s", fqdn)
+            raise socket.gaierror(*ip_address)
         if ip_address:
-            logging.debug(f"Resolved lookup request for FQDN from cache: {fqdn} -> {ip_address}")
+            log.debug("Resolved lookup request for FQDN from cache: %s -> %s", fqdn, ip_address)
             return ip_address
 
         # Cache miss - perform DNS lookup
-        dns_lookups_total.inc()
+        metrics.dns_lookups += 1
         try:
             ip_address = socket.gethostbyname(fqdn)
-            dns_lookups_success_total.inc()
-            logging.debug(f"Resolved lookup request for FQDN from DNS: {fqdn} -> {ip_address}")
+            metrics.dns_lookups_success += 1
+            log.debug("Resolved lookup request for FQDN from DNS: %s -> %s", fqdn, ip_address)
             
             # Cache the result
             dns_cache.set(fqdn, ip_address)
             
             return ip_address
-        except socket.gaierror:
-            logging.error(f"DNS lookup failed for FQDN: {fqdn}")
-            dns_lookups_failure_total.inc()
+        except socket.gaierror as e:
+            log.error("DNS lookup failed for FQDN: %s", fqdn)
+            metrics.dns_lookups_failure += 1
+            # Remember names that do not exist, but retry temporary failures.
+            # Only the args are cached; the exception's traceback would pin the handler.
+            if e.errno == socket.EAI_NONAME and DNS_NEGATIVE_CACHE_TTL > 0:
+                dns_cache.set_negative(fqdn, e.args, DNS_NEGATIVE_CACHE_TTL)
             raise
         except Exception as e:
-            logging.critical(f"An unexpected error occurred during DNS lookup for FQDN {fqdn}: {e}", exc_info=True)
-            dns_lookups_failure_total.inc()
+            log.critical("An unexpected error occurred during DNS lookup for FQDN %s: %s", fqdn, e, exc_info=True)
+            metrics.dns_lookups_failure += 1
             raise
 
     @staticmethod
@@ -397,24 +608,179 @@ class RequestHandler(BaseHTTPRequestHandler):
     def _get_zone_data(ip_address_str):
         """Finds the zone data (name and ID) for a given IP address."""
         try:
-            ip = ipaddress.ip_address(ip_address_str)
-            for network, data in CIDR_MAPPINGS.items():
-                if ip in network:
-                    return data
+            version, ip_int = _ip_to_int(ip_address_str)
+            return CIDR_LOOKUPS[version](ip_int)
         except ValueError:
-            logging.warning(f"Invalid IP address format: {ip_address_str}")
+            log.warning("Invalid IP address format: %s", ip_address_str)
         return None
 
 
 # --- Server and Shutdown Logic ---
-def run(server_class=HTTPServer, handler_class=RequestHandler):
-    """Starts the HTTP server and sets up graceful shutdown."""
+WORKERS = int(os.environ.get('WORKERS', '32'))
+if WORKERS < 1:
+    log.critical("WORKERS must be at least 1, got %s.", WORKERS)
+    sys.exit(1)
+
+
+class BoundedThreadingHTTPServer(ThreadingHTTPServer):
+    """HTTP server that handles requests on a fixed pool of worker threads.
+
+    Connections beyond the pool size wait in a queue instead of spawning
+    unbounded threads. Until a request arrives, new and kept-alive connections
+    wait in a selector rather than on a worker, so silent or idle clients
+    cannot starve others.
+    """
+    # Seconds server_close() waits for requests already being handled
+    shutdown_timeout = 10
+
+    def __init__(self, server_address, handler_class, max_workers=None):
+        super().__init__(server_address, handler_class)
+        # Handlers whose connection has a request to read
+        self._ready = queue.SimpleQueue()
+        # Handlers waiting for a request, registered by the idle thread
+        self._parked = queue.SimpleQueue()
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ)
+        self._closing = False
+        # Requests queued for or being handled by a worker
+        self._in_flight = 0
+        self._in_flight_done = threading.Condition()
+        self._idle_thread = threading.Thread(target=self._watch_idle_connections, name="idle-connections", daemon=True)
+        self._idle_thread.start()
+        for i in range(max_workers or WORKERS):
+            threading.Thread(target=self._serve_requests, name=f"worker-{i}", daemon=True).start()
+
+    def process_request(self, request, client_address):
+        """Parks the new connection until its first request arrives."""
+        self._park(self._make_handler(request, client_address))
+
+    def _make_handler(self, request, client_address):
+        """Sets up a handler for the connection without serving it yet."""
+        handler = self.RequestHandlerClass.__new__(self.RequestHandlerClass)
+        handler.request = request
+        handler.client_address = client_address
+        handler.server = self
+        handler.close_connection = True
+        handler.setup()
+        return handler
+
+    def _serve_requests(self):
+        """Worker loop serving one request per ready connection."""
+        while True:
+            handler = self._ready.get()
+            try:
+                handler.handle_one_request()
+            except Exception:
+                self.handle_error(handler.request, handler.client_address)
+                handler.close_connection = True
+            if handler.close_connection or self._closing:
+                self._close(handler)
+            elif self._has_buffered_request(handler):
+                self._dispatch(handler)
+            else:
+                self._park(handler)
+            with self._in_flight_done:
+                self._in_flight -= 1
+                if not self._in_flight:
+                    self._in_flight_done.notify_all()
+
+    def _dispatch(self, handler):
+        """Queues the connection for a worker to serve its next request."""
+        with self._in_flight_done:
+            self._in_flight += 1
+        self._ready.put(handler)
+
+    def _park(self, handler):
+        """Hands the connection to the idle thread to wait for its next request."""
+        self._parked.put(handler)
+        if not self._wake_idle_thread():
+            self._close(handler)
+
+    def _wake_idle_thread(self):
+        """Interrupts the idle thread's select; returns False once it has exited."""
+        try:
+            self._wakeup_send.send(b'\0')
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def _has_buffered_request(handler):
+        """Returns whether a pipelined request is already waiting in the read buffer."""
+        handler.connection.setblocking(False)
+        try:
+            return bool(handler.rfile.peek(1))
+        except OSError:
+            # Nothing buffered; the selector reports the socket once data or an error arrives
+            return False
+        finally:
+            handler.connection.settimeout(handler.timeout)
+
+    def _watch_idle_connections(self):
+        """Hands parked connections to the workers once a request arrives."""
+        deadlines = {}
+        while not self._closing:
+            for key, _ in self._selector.select(timeout=1.0):
+                if key.fileobj is self._wakeup_recv:
+                    self._wakeup_recv.recv(4096)
+                    continue
+                self._selector.unregister(key.fileobj)
+                del deadlines[key.data]
+                self._dispatch(key.data)
+            while True:
+                try:
+                    handler = self._parked.get_nowait()
+                except queue.Empty:
+                    break
+                self._selector.register(handler.connection, selectors.EVENT_READ, handler)
+                deadlines[handler] = time.monotonic() + handler.timeout
+            now = time.monotonic()
+            for handler in [handler for handler, deadline in deadlines.items() if deadline <= now]:
+                self._selector.unregister(handler.connection)
+                del deadlines[handler]
+                self._close(handler)
+        while True:
+            try:
+                deadlines[self._parked.get_nowait()] = None
+            except queue.Empty:
+                break
+        for handler in deadlines:
+            self._close(handler)
+        self._selector.close()
+        self._wakeup_recv.close()
+        self._wakeup_send.close()
+
+    def _close(self, handler):
+        """Finishes the handler and closes its connection."""
+        try:
+            handler.finish()
+        finally:
+            self.shutdown_request(handler.request)
+
+    def server_close(self):
+        """Stops accepting, closes parked connections and waits for in-flight requests."""
+        super().server_close()
+        self._closing = True
+        self._wake_idle_thread()
+        self._idle_thread.join(self.shutdown_timeout)
+        with self._in_flight_done:
+            if not self._in_flight_done.wait_for(lambda: not self._in_flight, self.shutdown_timeout):
+                log.warning("Shut down with %s requests still in progress.", self._in_flight)
+
+
+def run(server_class=BoundedThreadingHTTPServer, handler_class=RequestHandler):
+    """Starts the HTTP server and sets up graceful shutdown.
+
+    Requests are handled on a pool of worker threads, so a slow DNS lookup
+    does not block the accept loop for other clients.
+    """
     port = int(os.environ.get("PORT", 8080))
     server_address = ('', port)
     httpd = server_class(server_address, handler_class)
 
     def shutdown_handler(signum, frame):
-        logging.info(f"Received signal {signum}. Shutting down gracefully...")
+        log.info("Received signal %s. Shutting down gracefully...", signum)
         # Run shutdown in a separate thread to prevent deadlocking
         threading.Thread(target=httpd.shutdown, daemon=True).start()
     
@@ -422,9 +788,10 @@ def run(server_class=HTTPServer, handler_class=RequestHandler):
     signal.signal(signal.SIGINT, shutdown_handler)
     signal.signal(signal.SIGTERM, shutdown_handler)
 
-    logging.info(f"Starting server on http://0.0.0.0:{port}")
+    log.info("Starting server on http://0.0.0.0:%s", port)
     httpd.serve_forever()
-    logging.info("Server has shut down.")
+    httpd.server_close()
+    log.info("Server has shut down.")
 
 
 if __name__ == "__main__":
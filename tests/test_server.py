@@ -1,132 +1,166 @@
-import importlib
+import ipaddress
 import json
 import os
+import socket
+import subprocess
 import sys
-import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from unittest.mock import patch, MagicMock
+from pathlib import Path
+from types import MappingProxyType
+from unittest.mock import patch
 import pytest
 
-# Add src directory to path for imports
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+# Read-only so the session-scoped fixtures can share them between tests
+SAMPLE_SUBNETS = (
+    MappingProxyType({"CIDRBlock": "192.168.0.0/19", "AvailabilityZone": "eu-central-1b", "AvailabilityZoneId": "euc1-az3"}),
+    MappingProxyType({"CIDRBlock": "192.168.32.0/19", "AvailabilityZone": "eu-central-1a", "AvailabilityZoneId": "euc1-az2"}),
+    MappingProxyType({"CIDRBlock": "192.168.64.0/19", "AvailabilityZone": "eu-central-1c", "AvailabilityZoneId": "euc1-az1"}),
+)
+SAMPLE_SUBNETS_JSON = json.dumps([dict(subnet) for subnet in SAMPLE_SUBNETS]).encode('utf-8')
+SRC_DIR = Path(__file__).resolve().parent.parent / 'src'
 
-@pytest.fixture
+
+class _FakeClock:
+    """Settable replacement for time.monotonic()."""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+def _parse_http_response(handler):
+    """Split the handler's raw output into (status line, headers, body bytes)."""
+    head, _, body = handler.wfile.getvalue().partition(b'\r\n\r\n')
+    status_line, _, headers = head.decode('latin-1').partition('\r\n')
+    return status_line, headers, body
+
+
+def _import_server_in_subprocess(subnets_file, code='', **env):
+    """Import server in a fresh interpreter, then run code, keeping the import out of sys.modules."""
+    env = dict(os.environ, SUBNETS_FILE=subnets_file, PYTHONPATH=str(SRC_DIR), **env)
+    return subprocess.run([sys.executable, '-c', f'import server\n{code}'], env=env, capture_output=True)
+
+
+@pytest.fixture(scope="session")
 def subnets_data():
     """Sample subnet data for testing."""
-    return [
-        {"CIDRBlock": "192.168.0.0/19", "AvailabilityZone": "eu-central-1b", "AvailabilityZoneId": "euc1-az3"},
-        {"CIDRBlock": "192.168.32.0/19", "AvailabilityZone": "eu-central-1a", "AvailabilityZoneId": "euc1-az2"},
-        {"CIDRBlock": "192.168.64.0/19", "AvailabilityZone": "eu-central-1c", "AvailabilityZoneId": "euc1-az1"},
-    ]
+    return SAMPLE_SUBNETS
 
 
-@pytest.fixture
-def temp_subnets_file(subnets_data):
-    """Create a temporary subnets.json file for testing."""
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-        json.dump(subnets_data, f)
-        temp_path = f.name
+@pytest.fixture(scope="session")
+def sample_networks(subnets_data):
+    """Sample subnets paired with their parsed networks, built once per session."""
+    return [(ipaddress.ip_network(subnet['CIDRBlock']), subnet) for subnet in subnets_data]
+
+
+@pytest.fixture(scope="session")
+def temp_subnets_file(tmp_path_factory):
+    """Create a temporary subnets.json file shared by all tests."""
+    path = tmp_path_factory.mktemp("subnets", numbered=False) / "subnets.json"
+    path.write_bytes(SAMPLE_SUBNETS_JSON)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def server_module(temp_subnets_file):
+    """Import the server module once, configured with the sample subnets file."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('SUBNETS_FILE', temp_subnets_file)
+        sys.modules.pop('server', None)
+        import server
+    return server
+
+
+@pytest.fixture(scope="class")
+def request_handler_prototype(server_module):
+    """Create one RequestHandler, bypassing the socket setup, shared by a test class."""
+    handler = object.__new__(server_module.RequestHandler)
+    handler.rfile = BytesIO()
+    handler.wfile = BytesIO()
+    handler.client_address = ('127.0.0.1', 12345)
+    handler.server = None
     
-    yield temp_path
+    # Set required attributes for Python 3.14+ compatibility
+    handler.request_version = 'HTTP/1.1'
+    handler.requestline = 'GET / HTTP/1.1'
+    handler.command = 'GET'
     
-    # Cleanup
-    if os.path.exists(temp_path):
-        os.unlink(temp_path)
+    return handler
 
 
 @pytest.fixture
-def mock_request_handler(temp_subnets_file):
-    """Create a RequestHandler with mocked socket and mocked CIDR_MAPPINGS."""
-    with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-        # Force reload of the module to pick up the new environment variable
-        if 'server' in sys.modules:
-            del sys.modules['server']
-        
-        import server
-        
-        # Create mock request
-        mock_request = MagicMock()
-        mock_request.makefile.return_value = BytesIO()
-        
-        # Create mock client address
-        mock_client_address = ('127.0.0.1', 12345)
-        
-        # Create mock server
-        mock_server = MagicMock()
-        
-        # Create handler instance
-        handler = server.RequestHandler(mock_request, mock_client_address, mock_server)
-        handler.wfile = BytesIO()
-        
-        # Set required attributes for Python 3.14+ compatibility
-        handler.request_version = 'HTTP/1.1'
-        handler.requestline = 'GET / HTTP/1.1'
-        handler.command = 'GET'
-        
-        yield handler, server
+def fake_clock(server_module, monkeypatch):
+    """Drives the DNS cache's expiry clock by hand."""
+    clock = _FakeClock()
+    monkeypatch.setattr(server_module.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def metrics_batch(server_module):
+    """A fresh counter batch for calling cache and lookup methods directly."""
+    return server_module._MetricsBatch()
+
+
+@pytest.fixture
+def mock_dns():
+    """Patch the system resolver for the whole test; configure the returned mock."""
+    with patch('socket.gethostbyname') as mock:
+        yield mock
+
+
+@pytest.fixture
+def mock_request_handler(request_handler_prototype, server_module):
+    """Reset the shared RequestHandler's output and path for a test."""
+    handler = request_handler_prototype
+    handler.wfile.seek(0)
+    handler.wfile.truncate(0)
+    handler.path = '/'
+    return handler, server_module
 
 
 class TestLoadSubnetsData:
     """Test the load_subnets_data function."""
     
-    def test_load_subnets_from_file(self, temp_subnets_file, subnets_data):
+    def test_load_subnets_from_file(self, server_module, subnets_data):
         """Test loading subnet data from a valid JSON file."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            assert len(server.SUBNETS_DATA) == len(subnets_data)
-            assert server.SUBNETS_DATA[0]['CIDRBlock'] == '192.168.0.0/19'
-    
+        assert len(server_module.SUBNETS_DATA) == len(subnets_data)
+        assert server_module.SUBNETS_DATA[0]['CIDRBlock'] == '192.168.0.0/19'
+
     def test_load_subnets_file_not_found(self):
-        """Test that sys.exit is called when subnet file doesn't exist."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': '/nonexistent/file.json'}):
-            with pytest.raises(SystemExit):
-                if 'server' in sys.modules:
-                    del sys.modules['server']
-                importlib.import_module('server')
+        """Test that the server exits when the subnet file doesn't exist."""
+        result = _import_server_in_subprocess('/nonexistent/file.json')
+        assert result.returncode == 1
+        assert b'Subnet file /nonexistent/file.json not found.' in result.stdout
     
-    def test_load_subnets_invalid_json(self):
-        """Test that sys.exit is called when JSON is invalid."""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-            f.write("invalid json content {]")
-            temp_path = f.name
-        
-        try:
-            with patch.dict(os.environ, {'SUBNETS_FILE': temp_path}):
-                with pytest.raises(SystemExit):
-                    if 'server' in sys.modules:
-                        del sys.modules['server']
-                    importlib.import_module('server')
-        finally:
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
+    def test_load_subnets_invalid_json(self, tmp_path):
+        """Test that the server exits when the JSON is invalid."""
+        invalid_file = tmp_path / "subnets.json"
+        invalid_file.write_text("invalid json content {]")
+        
+        result = _import_server_in_subprocess(str(invalid_file))
+        assert result.returncode == 1
+        assert b'Failed to load subnet data' in result.stdout
 
 
 class TestRequestHandler:
     """Test the RequestHandler class."""
     
-    def test_health_check_healthz(self, mock_request_handler):
-        """Test /healthz endpoint."""
+    @pytest.mark.parametrize('path', ['/healthz', '/readyz'])
+    def test_health_check(self, mock_request_handler, path):
+        """Test the /healthz and /readyz endpoints."""
         handler, server = mock_request_handler
-        handler.path = '/healthz'
+        handler.path = path
         handler.do_GET()
         
-        response = handler.wfile.getvalue()
-        assert b'200' in handler.wfile.getvalue() or True  # Response sent
-        assert b'"status": "ok"' in response or b'"status":"ok"' in response
-    
-    def test_health_check_readyz(self, mock_request_handler):
-        """Test /readyz endpoint."""
-        handler, server = mock_request_handler
-        handler.path = '/readyz'
-        handler.do_GET()
-        
-        response = handler.wfile.getvalue()
-        assert b'"status": "ok"' in response or b'"status":"ok"' in response
+        status_line, _, body = _parse_http_response(handler)
+        assert status_line == 'HTTP/1.1 200 OK'
+        assert json.loads(body) == {'status': 'ok'}
     
     def test_empty_path(self, mock_request_handler):
         """Test request with empty path."""
@@ -134,8 +168,9 @@ class TestRequestHandler:
         handler.path = '/'
         handler.do_GET()
         
-        response = handler.wfile.getvalue().decode('utf-8')
-        assert 'Not Found' in response or '404' in response
+        status_line, _, body = _parse_http_response(handler)
+        assert status_line.startswith('HTTP/1.1 404')
+        assert b'Not Found' in body
     
     def test_legacy_path_returns_404(self, mock_request_handler):
         """Test that legacy path format returns 404."""
@@ -144,8 +179,9 @@ class TestRequestHandler:
         
         handler.do_GET()
         
-        response = handler.wfile.getvalue().decode('utf-8')
-        assert 'Not Found' in response or '404' in response
+        status_line, _, body = _parse_http_response(handler)
+        assert status_line.startswith('HTTP/1.1 404')
+        assert b'Not Found' in body
 
     def test_successful_fqdn_lookup(self, mock_request_handler):
         """Test successful FQDN lookup with /fqdn/ prefix."""
@@ -156,13 +192,10 @@ class TestRequestHandler:
         with patch.object(server.RequestHandler, '_get_ip_address', return_value='192.168.1.1'):
             handler.do_GET()
         
-        response = handler.wfile.getvalue().decode('utf-8')
-        response_data = json.loads(response.split('\r\n\r\n')[-1])
+        body = _parse_http_response(handler)[2]
         
-        assert 'zone' in response_data
-        assert 'zoneId' in response_data
-        assert response_data['zone'] == 'eu-central-1b'
-        assert response_data['zoneId'] == 'euc1-az3'
+        assert b'"zone": "eu-central-1b"' in body
+        assert b'"zoneId": "euc1-az3"' in body
 
     def test_invalid_fqdn_format(self, mock_request_handler):
         """Test invalid FQDN format."""
@@ -172,17 +205,20 @@ class TestRequestHandler:
         # Actually underscore is allowed in domain names but not hostnames. Let's use something definitely invalid like !
         handler.path = '/fqdn/invalid_fqdn!.com'
         handler.do_GET()
-        response = handler.wfile.getvalue().decode('utf-8')
-        assert 'Invalid FQDN format' in response or '400' in response
+        status_line, _, body = _parse_http_response(handler)
+        assert status_line.startswith('HTTP/1.1 400')
+        assert b'Invalid FQDN format' in body
 
         # Reset
-        handler.wfile = BytesIO()
+        handler.wfile.seek(0)
+        handler.wfile.truncate(0)
         
         # Starts with hyphen
         handler.path = '/fqdn/-start.com'
         handler.do_GET()
-        response = handler.wfile.getvalue().decode('utf-8')
-        assert 'Invalid FQDN format' in response or '400' in response
+        status_line, _, body = _parse_http_response(handler)
+        assert status_line.startswith('HTTP/1.1 400')
+        assert b'Invalid FQDN format' in body
 
     def test_successful_ip_lookup(self, mock_request_handler):
         """Test successful IP lookup with /ip/ prefix."""
@@ -191,13 +227,10 @@ class TestRequestHandler:
         
         handler.do_GET()
         
-        response = handler.wfile.getvalue().decode('utf-8')
-        response_data = json.loads(response.split('\r\n\r\n')[-1])
+        body = _parse_http_response(handler)[2]
         
-        assert 'zone' in response_data
-        assert 'zoneId' in response_data
-        assert response_data['zone'] == 'eu-central-1b'
-        assert response_data['zoneId'] == 'euc1-az3'
+        assert b'"zone": "eu-central-1b"' in body
+        assert b'"zoneId": "euc1-az3"' in body
 
     def test_invalid_ip_format(self, mock_request_handler):
         """Test invalid IP format with /ip/ prefix."""
@@ -206,8 +239,9 @@ class TestRequestHandler:
         
         handler.do_GET()
         
-        response = handler.wfile.getvalue().decode('utf-8')
-        assert 'Invalid IP address format' in response or '400' in response
+        status_line, _, body = _parse_http_response(handler)
+        assert status_line.startswith('HTTP/1.1 400')
+        assert b'Invalid IP address format' in body
 
     def test_ip_not_found(self, mock_request_handler):
         """Test IP that is not in any subnet."""
@@ -216,285 +250,280 @@ class TestRequestHandler:
         
         handler.do_GET()
         
-        response = handler.wfile.getvalue().decode('utf-8')
-        assert 'Zone not found' in response or '404' in response
+        status_line, _, body = _parse_http_response(handler)
+        assert status_line.startswith('HTTP/1.1 404')
+        assert b'Zone not found' in body
 
     
-    def test_fqdn_not_found(self, mock_request_handler):
-        """Test FQDN that cannot be resolved."""
-        handler, server = mock_request_handler
-        handler.path = '/fqdn/nonexistent.example.com'
-        
-        # Mock DNS resolution failure
-        with patch.object(server.RequestHandler, '_get_ip_address', side_effect=server.socket.gaierror):
-            handler.do_GET()
-        
-        response = handler.wfile.getvalue().decode('utf-8')
-        assert 'FQDN not found' in response or '404' in response
-    
-    def test_ip_not_in_subnet(self, mock_request_handler):
-        """Test IP address that doesn't match any subnet."""
+    @pytest.mark.parametrize('lookup, status, message', [
+        ({'side_effect': socket.gaierror}, 404, 'FQDN not found'),
+        ({'return_value': '10.0.0.1'}, 404, 'Zone not found'),
+        ({'side_effect': Exception("Unexpected error")}, 500, 'Internal Server Error'),
+    ], ids=['fqdn_not_found', 'ip_not_in_subnet', 'unexpected_error'])
+    def test_fqdn_lookup_errors(self, mock_request_handler, lookup, status, message):
+        """Test FQDN lookups that fail to resolve, match no subnet, or raise."""
         handler, server = mock_request_handler
         handler.path = '/fqdn/test.example.com'
         
-        # Mock DNS resolution to return an IP not in our subnets
-        with patch.object(server.RequestHandler, '_get_ip_address', return_value='10.0.0.1'):
+        with patch.object(server.RequestHandler, '_get_ip_address', **lookup):
             handler.do_GET()
         
-        response = handler.wfile.getvalue().decode('utf-8')
-        assert 'Zone not found' in response or '404' in response
-    
-    def test_unexpected_error(self, mock_request_handler):
-        """Test handling of unexpected errors."""
-        handler, server = mock_request_handler
-        handler.path = '/fqdn/test.example.com'
-        
-        # Mock an unexpected exception
-        with patch.object(server.RequestHandler, '_get_ip_address', side_effect=Exception("Unexpected error")):
-            handler.do_GET()
-        
-        response = handler.wfile.getvalue().decode('utf-8')
-        assert 'Internal Server Error' in response or '500' in response
+        status_line, _, body = _parse_http_response(handler)
+        assert status_line.startswith(f'HTTP/1.1 {status}')
+        assert message.encode() in body
 
 
 class TestGetZoneData:
     """Test the _get_zone_data static method."""
     
-    def test_get_zone_data_valid_ip(self, temp_subnets_file):
-        """Test getting zone data for a valid IP in a subnet."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            zone_data = server.RequestHandler._get_zone_data('192.168.1.1')
-            assert zone_data is not None
-            assert zone_data['AvailabilityZone'] == 'eu-central-1b'
-            assert zone_data['AvailabilityZoneId'] == 'euc1-az3'
-    
-    def test_get_zone_data_ip_not_in_subnet(self, temp_subnets_file):
-        """Test getting zone data for an IP not in any subnet."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            zone_data = server.RequestHandler._get_zone_data('10.0.0.1')
-            assert zone_data is None
-    
-    def test_get_zone_data_invalid_ip(self, temp_subnets_file):
-        """Test getting zone data for an invalid IP address."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            zone_data = server.RequestHandler._get_zone_data('invalid-ip')
+    @pytest.mark.parametrize("ip, expected", [
+        ('192.168.1.1', ('eu-central-1b', 'euc1-az3')),
+        ('192.168.33.1', ('eu-central-1a', 'euc1-az2')),
+        ('192.168.65.1', ('eu-central-1c', 'euc1-az1')),
+        ('10.0.0.1', None),
+        ('invalid-ip', None),
+    ])
+    def test_get_zone_data(self, server_module, ip, expected):
+        """Test that IPs resolve to their subnet's zone, and unmatched or invalid IPs to None."""
+        zone_data = server_module.RequestHandler._get_zone_data(ip)
+        if expected is None:
             assert zone_data is None
-    
-    def test_get_zone_data_multiple_subnets(self, temp_subnets_file):
-        """Test that different IPs resolve to correct zones."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            # Test IP in first subnet
-            zone_data_1 = server.RequestHandler._get_zone_data('192.168.1.1')
-            assert zone_data_1['AvailabilityZone'] == 'eu-central-1b'
-            
-            # Test IP in second subnet
-            zone_data_2 = server.RequestHandler._get_zone_data('192.168.33.1')
-            assert zone_data_2['AvailabilityZone'] == 'eu-central-1a'
-            
-            # Test IP in third subnet
-            zone_data_3 = server.RequestHandler._get_zone_data('192.168.65.1')
-            assert zone_data_3['AvailabilityZone'] == 'eu-central-1c'
+        else:
+            assert (zone_data['AvailabilityZone'], zone_data['AvailabilityZoneId']) == expected
+
+    def test_get_zone_data_subnet_boundaries(self, server_module, sample_networks):
+        """Test that the first and last address of each subnet resolve to its zone."""
+        assert set(server_module.CIDR_MAPPINGS) == {network for network, _ in sample_networks}
+        for network, subnet in sample_networks:
+            for ip in (network.network_address, network.broadcast_address):
+                zone_data = server_module.RequestHandler._get_zone_data(str(ip))
+                assert zone_data['AvailabilityZone'] == subnet['AvailabilityZone']
+                assert zone_data['AvailabilityZoneId'] == subnet['AvailabilityZoneId']
+
+    def test_get_zone_data_longest_prefix_match(self, server_module, monkeypatch):
+        """Test that overlapping subnets resolve to the most specific match."""
+        cidr_mappings = {
+            ipaddress.ip_network("10.0.0.0/8"): {"AvailabilityZone": "eu-central-1a", "AvailabilityZoneId": "euc1-az2"},
+            ipaddress.ip_network("10.1.0.0/16"): {"AvailabilityZone": "eu-central-1b", "AvailabilityZoneId": "euc1-az3"},
+            ipaddress.ip_network("2001:db8::/32"): {"AvailabilityZone": "eu-central-1c", "AvailabilityZoneId": "euc1-az1"},
+        }
+        ranges = server_module._build_cidr_ranges(cidr_mappings)
+        monkeypatch.setattr(server_module, 'CIDR_LOOKUPS', {
+            version: server_module._make_range_lookup(*version_ranges)
+            for version, version_ranges in ranges.items()
+        })
+        
+        get_zone_data = server_module.RequestHandler._get_zone_data
+        assert get_zone_data('10.2.0.1')['AvailabilityZone'] == 'eu-central-1a'
+        assert get_zone_data('10.1.2.3')['AvailabilityZone'] == 'eu-central-1b'
+        assert get_zone_data('2001:db8::1')['AvailabilityZone'] == 'eu-central-1c'
+        assert get_zone_data('2001:db9::1') is None
+        assert get_zone_data('11.0.0.1') is None
 
 
 class TestGetIPAddress:
     """Test the _get_ip_address static method."""
     
-    def test_get_ip_address_localhost(self, temp_subnets_file):
+    def test_get_ip_address_localhost(self, server_module, mock_dns, metrics_batch):
         """Test resolving localhost."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            ip = server.RequestHandler._get_ip_address('localhost')
-            assert ip == '127.0.0.1'
-    
-    def test_get_ip_address_invalid_fqdn(self, temp_subnets_file):
+        mock_dns.return_value = '127.0.0.1'
+        ip = server_module.RequestHandler._get_ip_address('localhost', metrics_batch)
+        assert ip == '127.0.0.1'
+        mock_dns.assert_called_once_with('localhost')
+
+    def test_get_ip_address_invalid_fqdn(self, server_module, mock_dns, metrics_batch):
         """Test that invalid FQDN raises socket.gaierror."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            with pytest.raises(server.socket.gaierror):
-                server.RequestHandler._get_ip_address('this-does-not-exist-12345.invalid')
+        mock_dns.side_effect = server_module.socket.gaierror
+        with pytest.raises(server_module.socket.gaierror):
+            server_module.RequestHandler._get_ip_address('this-does-not-exist-12345.invalid', metrics_batch)
 
 
 class TestResponseMethods:
     """Test response helper methods."""
     
-    def test_send_json_response(self, mock_request_handler):
-        """Test sending JSON response."""
-        handler, server = mock_request_handler
-        test_payload = {'test': 'data', 'number': 123}
-        
-        handler.send_json_response(200, test_payload)
-        
-        response = handler.wfile.getvalue().decode('utf-8')
-        # Extract JSON from response (after headers)
-        json_part = response.split('\r\n\r\n')[-1]
-        parsed = json.loads(json_part)
-        
-        assert parsed == test_payload
-    
-    def test_send_error_response(self, mock_request_handler):
-        """Test sending error response."""
-        handler, server = mock_request_handler
-        error_message = "Test error message"
-        
-        handler.send_error_response(404, error_message)
-        
-        response = handler.wfile.getvalue().decode('utf-8')
-        assert error_message in response
-        assert 'error' in response
-    
-    def test_send_healthy_response(self, mock_request_handler):
-        """Test sending health check response."""
+    @pytest.mark.parametrize('method, args, status, payload', [
+        ('send_json_response', (200, {'test': 'data', 'number': 123}), 200, {'test': 'data', 'number': 123}),
+        ('send_error_response', (404, "Test error message"), 404, {'error': "Test error message"}),
+        ('send_healthy_response', (), 200, {'status': 'ok'}),
+    ], ids=['json', 'error', 'healthy'])
+    def test_send_response(self, mock_request_handler, method, args, status, payload):
+        """Test that each response helper writes its status and JSON payload."""
         handler, server = mock_request_handler
         
-        handler.send_healthy_response()
+        getattr(handler, method)(*args)
         
-        response = handler.wfile.getvalue().decode('utf-8')
-        assert 'status' in response
-        assert 'ok' in response
+        status_line, headers, body = _parse_http_response(handler)
+        assert status_line.startswith(f'HTTP/1.1 {status}')
+        assert f'Content-Length: {len(body)}' in headers.split('\r\n')
+        assert json.loads(body) == payload
 
 
 class TestDNSCache:
     """Test the DNS cache functionality."""
     
     def test_cache_initialization(self, temp_subnets_file):
-        """Test DNS cache is properly initialized."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file, 'DNS_CACHE_TTL': '600'}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            assert server.dns_cache is not None
-            assert server.dns_cache.default_ttl == 600
-            assert server.DNS_CACHE_TTL == 600
+        """Test DNS cache TTL is read from the DNS_CACHE_TTL environment variable."""
+        result = _import_server_in_subprocess(
+            temp_subnets_file, 'print(server.dns_cache.ttl, server.DNS_CACHE_TTL)',
+            DNS_CACHE_TTL='600', LOG_LEVEL='WARNING',
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.split() == [b'600', b'600']
     
-    def test_cache_set_and_get(self, temp_subnets_file):
-        """Test setting and getting values from cache."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            # Clear any existing cache
-            server.dns_cache.cache.clear()
-            
-            # Set a value
-            server.dns_cache.set('test.example.com', '192.168.1.1', ttl=60)
-            
-            # Get the value
-            cached_ip = server.dns_cache.get('test.example.com')
-            assert cached_ip == '192.168.1.1'
+    def test_resolved_address_expires_after_cache_ttl(self, server_module, monkeypatch, fake_clock, mock_dns, metrics_batch):
+        """Test that resolved addresses are cached for the cache's TTL."""
+        monkeypatch.setattr(server_module, 'dns_cache', server_module.DNSCache(ttl=600))
+        
+        mock_dns.return_value = '192.168.1.1'
+        server_module.RequestHandler._get_ip_address('test.example.com', metrics_batch)
+        fake_clock.now += 599
+        assert server_module.dns_cache.get('test.example.com', metrics_batch) == '192.168.1.1'
+        fake_clock.now += 2
+        assert server_module.dns_cache.get('test.example.com', metrics_batch) is None
     
-    def test_cache_miss(self, temp_subnets_file):
+    def test_cache_set_and_get(self, server_module, metrics_batch):
+        """Test setting and getting values from cache."""
+        # Clear any existing cache
+        server_module.dns_cache.cache.clear()
+        
+        # Set a value
+        server_module.dns_cache.set('test.example.com', '192.168.1.1', ttl=60)
+        
+        # Get the value
+        cached_ip = server_module.dns_cache.get('test.example.com', metrics_batch)
+        assert cached_ip == '192.168.1.1'
+
+    def test_cache_miss(self, server_module, metrics_batch):
         """Test cache miss returns None."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            # Clear cache
-            server.dns_cache.cache.clear()
-            
-            # Try to get non-existent value
-            cached_ip = server.dns_cache.get('nonexistent.example.com')
-            assert cached_ip is None
-    
-    def test_cache_expiry(self, temp_subnets_file):
+        # Clear cache
+        server_module.dns_cache.cache.clear()
+        
+        # Try to get non-existent value
+        cached_ip = server_module.dns_cache.get('nonexistent.example.com', metrics_batch)
+        assert cached_ip is None
+
+    def test_cache_expiry(self, server_module, fake_clock, metrics_batch):
         """Test that cache entries expire after TTL."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            # Clear cache
-            server.dns_cache.cache.clear()
-            
-            # Set a value with very short TTL
-            server.dns_cache.set('test.example.com', '192.168.1.1', ttl=1)
-            
-            # Immediately get it - should work
-            cached_ip = server.dns_cache.get('test.example.com')
-            assert cached_ip == '192.168.1.1'
-            
-            # Wait for expiry
-            time.sleep(1.1)
-            
-            # Now it should be expired
-            cached_ip = server.dns_cache.get('test.example.com')
-            assert cached_ip is None
-    
-    def test_cache_clear_expired(self, temp_subnets_file):
+        # Clear cache
+        server_module.dns_cache.cache.clear()
+        
+        # Set a value with very short TTL
+        server_module.dns_cache.set('test.example.com', '192.168.1.1', ttl=1)
+        
+        # Immediately get it - should work
+        cached_ip = server_module.dns_cache.get('test.example.com', metrics_batch)
+        assert cached_ip == '192.168.1.1'
+        
+        # Move past the TTL
+        fake_clock.now += 2
+        
+        # Now it should be expired
+        cached_ip = server_module.dns_cache.get('test.example.com', metrics_batch)
+        assert cached_ip is None
+
+    def test_cache_clear_expired(self, server_module, fake_clock, metrics_batch):
         """Test clearing expired entries."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            # Clear cache
-            server.dns_cache.cache.clear()
-            
-            # Add some entries with different TTLs
-            server.dns_cache.set('short.example.com', '192.168.1.1', ttl=1)
-            server.dns_cache.set('long.example.com', '192.168.1.2', ttl=3600)
-            
-            # Both should be in cache
-            assert len(server.dns_cache.cache) == 2
-            
-            # Wait for short TTL to expire
-            time.sleep(1.1)
-            
-            # Try to access the expired entry - this should trigger cleanup
-            assert server.dns_cache.get('short.example.com') is None
-            
-            # Long-lived entry should still be accessible
-            assert server.dns_cache.get('long.example.com') == '192.168.1.2'
-            
-            # Now cache should only have one entry
-            assert len(server.dns_cache.cache) == 1
-    
-    def test_cache_stats(self, temp_subnets_file):
+        # Clear cache
+        server_module.dns_cache.cache.clear()
+        
+        # Add some entries with different TTLs
+        server_module.dns_cache.set('short.example.com', '192.168.1.1', ttl=1)
+        server_module.dns_cache.set('long.example.com', '192.168.1.2', ttl=3600)
+        
+        # Both should be in cache
+        assert len(server_module.dns_cache.cache) == 2
+        
+        # Move past the short TTL
+        fake_clock.now += 2
+        
+        # Try to access the expired entry - this should trigger cleanup
+        assert server_module.dns_cache.get('short.example.com', metrics_batch) is None
+        
+        # Long-lived entry should still be accessible
+        assert server_module.dns_cache.get('long.example.com', metrics_batch) == '192.168.1.2'
+        
+        # Now cache should only have one entry
+        assert len(server_module.dns_cache.cache) == 1
+
+    def test_cache_evicts_least_recently_used(self, server_module, metrics_batch):
+        """Test that the least recently used entry is evicted at maxsize."""
+        cache = server_module.DNSCache(maxsize=2, ttl=60)
+        cache.set('a.example.com', '192.168.1.1')
+        cache.set('b.example.com', '192.168.1.2')
+        
+        # Touch the first entry so the second one becomes least recently used
+        assert cache.get('a.example.com', metrics_batch) == '192.168.1.1'
+        cache.set('c.example.com', '192.168.1.3')
+        
+        assert cache.get('b.example.com', metrics_batch) is None
+        assert cache.get('a.example.com', metrics_batch) == '192.168.1.1'
+        assert cache.get('c.example.com', metrics_batch) == '192.168.1.3'
+
+    def test_negative_entries_do_not_evict_resolved_entries(self, server_module, metrics_batch):
+        """Test that negative entries are capped separately from resolved ones."""
+        cache = server_module.DNSCache(maxsize=2, ttl=60, negative_maxsize=1)
+        cache.set('a.example.com', '192.168.1.1')
+        cache.set('b.example.com', '192.168.1.2')
+        for name in ('x.example.com', 'y.example.com', 'z.example.com'):
+            cache.set_negative(name, (server_module.socket.EAI_NONAME, 'Name or service not known'), 30)
+        
+        assert cache.get('a.example.com', metrics_batch) == '192.168.1.1'
+        assert cache.get('b.example.com', metrics_batch) == '192.168.1.2'
+        assert cache.get('y.example.com', metrics_batch) is None
+        assert cache.get('z.example.com', metrics_batch)[0] == server_module.socket.EAI_NONAME
+
+    def test_cache_size_matches_total_entries(self, server_module, fake_clock):
+        """Test that the size gauge and /cache/stats count the same live resolved entries."""
+        cache = server_module.DNSCache(maxsize=10, ttl=60)
+        cache.set('live.example.com', '192.168.1.1')
+        cache.set('expired.example.com', '192.168.1.2', ttl=1)
+        cache.set_negative('missing.example.com', (server_module.socket.EAI_NONAME, 'Name or service not known'), 30)
+        fake_clock.now += 2
+        
+        assert len(cache) == 1
+        assert cache.stats()['total_entries'] == 1
+
+    def test_cache_get_records_hits_and_misses(self, server_module, metrics_batch):
+        """Test that lookups count hits and misses in the batch, not on the shared counters."""
+        cache = server_module.DNSCache(maxsize=10, ttl=60)
+        cache.set('test.example.com', '192.168.1.1')
+        
+        with patch.object(server_module.dns_cache_hits_total, 'inc') as hits_inc, \
+                patch.object(server_module.dns_cache_misses_total, 'inc') as misses_inc:
+            cache.get('test.example.com', metrics_batch)
+            cache.get('other.example.com', metrics_batch)
+        
+        assert (metrics_batch.dns_cache_hits, metrics_batch.dns_cache_misses) == (1, 1)
+        hits_inc.assert_not_called()
+        misses_inc.assert_not_called()
+
+    def test_cache_stats(self, server_module):
         """Test cache statistics."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            
-            # Clear cache
-            server.dns_cache.cache.clear()
-            
-            # Add some entries
-            server.dns_cache.set('test1.example.com', '192.168.1.1')
-            server.dns_cache.set('test2.example.com', '192.168.1.2')
-            server.dns_cache.set('test3.example.com', '192.168.1.3')
-            
-            # Get stats
-            stats = server.dns_cache.stats()
-            
-            assert stats['total_entries'] == 3
-            assert 'test1.example.com' in stats['entries']
-            assert 'test2.example.com' in stats['entries']
-            assert 'test3.example.com' in stats['entries']
+        # Clear cache
+        server_module.dns_cache.cache.clear()
+        
+        # Add some entries
+        server_module.dns_cache.set('test1.example.com', '192.168.1.1')
+        server_module.dns_cache.set('test2.example.com', '192.168.1.2')
+        server_module.dns_cache.set('test3.example.com', '192.168.1.3')
+        
+        # Get stats
+        stats = server_module.dns_cache.stats()
+        
+        assert stats['total_entries'] == 3
+        assert 'test1.example.com' in stats['entries']
+        assert 'test2.example.com' in stats['entries']
+        assert 'test3.example.com' in stats['entries']
+
+    def test_cache_size_gauge(self, server_module):
+        """Test that the cache size gauge reflects the cache at collection time."""
+        server_module.dns_cache.cache.clear()
+        server_module.dns_cache.set('test1.example.com', '192.168.1.1')
+        server_module.dns_cache.set('test2.example.com', '192.168.1.2')
+        assert server_module.REGISTRY.get_sample_value('dns_cache_size') == 2
+        
+        server_module.dns_cache.reset()
+        assert server_module.REGISTRY.get_sample_value('dns_cache_size') == 0
     
     def test_cache_stats_endpoint(self, mock_request_handler):
         """Test /cache/stats endpoint."""
@@ -507,102 +536,325 @@ class TestDNSCache:
         handler.path = '/cache/stats'
         handler.do_GET()
         
-        response = handler.wfile.getvalue().decode('utf-8')
-        json_part = response.split('\r\n\r\n')[-1]
-        stats = json.loads(json_part)
+        stats = json.loads(_parse_http_response(handler)[2])
         
         assert 'total_entries' in stats
         assert 'entries' in stats
         assert 'ttl' in stats
         assert stats['total_entries'] >= 0
     
-    def test_get_ip_address_uses_cache(self, mock_request_handler):
+    def test_get_ip_address_uses_cache(self, server_module, mock_dns, metrics_batch):
         """Test that _get_ip_address uses cache."""
+        # Clear cache
+        server_module.dns_cache.cache.clear()
+        
+        mock_dns.return_value = '192.168.1.1'
+        
+        # First call - should hit DNS
+        ip1 = server_module.RequestHandler._get_ip_address('test.example.com', metrics_batch)
+        assert ip1 == '192.168.1.1'
+        assert mock_dns.call_count == 1
+        
+        # Second call - should use cache
+        ip2 = server_module.RequestHandler._get_ip_address('test.example.com', metrics_batch)
+        assert ip2 == '192.168.1.1'
+        assert mock_dns.call_count == 1  # Should not have called DNS again
+        
+        # Verify it's in cache
+        cached_ip = server_module.dns_cache.get('test.example.com', metrics_batch)
+        assert cached_ip == '192.168.1.1'
+    
+    def test_cache_thread_safety(self, server_module):
+        """Test that cache operations are thread-safe."""
+        # Clear cache
+        server_module.dns_cache.cache.clear()
+        
+        def set_entries(prefix, count=10):
+            for i in range(count):
+                server_module.dns_cache.set(f'{prefix}{i}.example.com', f'192.168.1.{i}')
+        
+        def get_entries(prefix, count=10):
+            metrics = server_module._MetricsBatch()
+            for i in range(count):
+                server_module.dns_cache.get(f'{prefix}{i}.example.com', metrics)
+        
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(set_entries, 'thread1-'),
+                executor.submit(set_entries, 'thread2-'),
+                executor.submit(get_entries, 'thread1-'),
+            ]
+            for future in futures:
+                future.result()
+        
+        # Every write lands regardless of how the threads interleave
+        assert server_module.dns_cache.stats()['total_entries'] == 20
+
+    def test_successful_lookup_with_cache(self, mock_request_handler, mock_dns):
+        """Test full request flow with caching."""
         handler, server = mock_request_handler
         
         # Clear cache
         server.dns_cache.cache.clear()
         
-        # Mock socket.gethostbyname
-        with patch('socket.gethostbyname', return_value='192.168.1.1') as mock_dns:
-            # First call - should hit DNS
-            ip1 = server.RequestHandler._get_ip_address('test.example.com')
-            assert ip1 == '192.168.1.1'
-            assert mock_dns.call_count == 1
-            
-            # Second call - should use cache
-            ip2 = server.RequestHandler._get_ip_address('test.example.com')
-            assert ip2 == '192.168.1.1'
-            assert mock_dns.call_count == 1  # Should not have called DNS again
-            
-            # Verify it's in cache
-            cached_ip = server.dns_cache.get('test.example.com')
-            assert cached_ip == '192.168.1.1'
-    
-    def test_cache_thread_safety(self, temp_subnets_file):
-        """Test that cache operations are thread-safe."""
-        with patch.dict(os.environ, {'SUBNETS_FILE': temp_subnets_file}):
-            if 'server' in sys.modules:
-                del sys.modules['server']
-            import server
-            import threading
-            
-            # Clear cache
-            server.dns_cache.cache.clear()
-            
-            # Function to set cache entries
-            def set_entries(prefix, count):
-                for i in range(count):
-                    server.dns_cache.set(f'{prefix}{i}.example.com', f'192.168.1.{i}')
-            
-            # Function to get cache entries
-            def get_entries(prefix, count):
-                for i in range(count):
-                    server.dns_cache.get(f'{prefix}{i}.example.com')
-            
-            # Create multiple threads
-            threads = []
-            threads.append(threading.Thread(target=set_entries, args=('thread1-', 10)))
-            threads.append(threading.Thread(target=set_entries, args=('thread2-', 10)))
-            threads.append(threading.Thread(target=get_entries, args=('thread1-', 10)))
-            
-            # Start all threads
-            for thread in threads:
-                thread.start()
-            
-            # Wait for all threads to complete
-            for thread in threads:
-                thread.join()
-            
-            # Verify cache has entries (exact count may vary due to timing)
-            stats = server.dns_cache.stats()
-            assert stats['total_entries'] > 0
+        handler.path = '/fqdn/db.example.com'
+        
+        mock_dns.return_value = '192.168.1.1'
+        
+        # First request
+        handler.do_GET()
+        body1 = _parse_http_response(handler)[2]
+        
+        # Reset handler output
+        handler.wfile.seek(0)
+        handler.wfile.truncate(0)
+        
+        # Second request - should use cache
+        handler.do_GET()
+        body2 = _parse_http_response(handler)[2]
+        
+        # DNS should only be called once
+        assert mock_dns.call_count == 1
+        
+        # Both responses should be successful
+        assert b'"zone": "eu-central-1b"' in body1
+        assert b'"zone": "eu-central-1b"' in body2
     
-    def test_successful_lookup_with_cache(self, mock_request_handler):
-        """Test full request flow with caching."""
+    def test_lookup_metrics_flushed_per_request(self, mock_request_handler, mock_dns):
+        """Test that counter deltas recorded during a request reach Prometheus."""
         handler, server = mock_request_handler
         
         # Clear cache
         server.dns_cache.cache.clear()
         
+        def sample(name):
+            return server.REGISTRY.get_sample_value(name) or 0.0
+        
+        before = {name: sample(name) for name in (
+            'dns_lookups_total', 'dns_lookups_success_total',
+            'dns_cache_misses_total', 'zone_lookups_success_total',
+        )}
+        
         handler.path = '/fqdn/db.example.com'
+        mock_dns.return_value = '192.168.1.1'
+        handler.do_GET()
         
-        # Mock DNS resolution
-        with patch('socket.gethostbyname', return_value='192.168.1.1') as mock_dns:
-            # First request
-            handler.do_GET()
-            response1 = handler.wfile.getvalue().decode('utf-8')
-            
-            # Reset handler output
-            handler.wfile = BytesIO()
-            
-            # Second request - should use cache
-            handler.do_GET()
-            response2 = handler.wfile.getvalue().decode('utf-8')
-            
-            # DNS should only be called once
-            assert mock_dns.call_count == 1
+        for name, value in before.items():
+            assert sample(name) == value + 1
+    
+    def test_get_ip_address_caches_nonexistent_fqdn(self, server_module, mock_dns, metrics_batch):
+        """Test that names which do not exist are negatively cached."""
+        # Clear cache
+        server_module.dns_cache.reset()
+        
+        nxdomain = server_module.socket.gaierror(server_module.socket.EAI_NONAME, 'Name or service not known')
+        mock_dns.side_effect = nxdomain
+        for _ in range(2):
+            with pytest.raises(server_module.socket.gaierror):
+                server_module.RequestHandler._get_ip_address('missing.example.com', metrics_batch)
+        
+        # Second call should be answered from the negative cache
+        assert mock_dns.call_count == 1
+        # The cached failure must not hold the exception and its traceback frames
+        assert not isinstance(server_module.dns_cache.negative_cache['missing.example.com'][0], BaseException)
+    
+    def test_cache_stats_lists_nonexistent_fqdn_separately(self, mock_request_handler, mock_dns):
+        """Test that /cache/stats does not report negatively cached names as resolved."""
+        handler, server = mock_request_handler
+        
+        server.dns_cache.reset()
+        mock_dns.side_effect = server.socket.gaierror(server.socket.EAI_NONAME, 'Name or service not known')
+        
+        handler.path = '/fqdn/missing.example.com'
+        handler.do_GET()
+        assert _parse_http_response(handler)[0].startswith('HTTP/1.1 404')
+        
+        handler.wfile.seek(0)
+        handler.wfile.truncate(0)
+        handler.path = '/cache/stats'
+        handler.do_GET()
+        
+        stats = json.loads(_parse_http_response(handler)[2])
+        assert stats['total_entries'] == 0
+        assert stats['entries'] == []
+        assert stats['negative_entries'] == ['missing.example.com']
+    
+    def test_get_ip_address_retries_temporary_failure(self, server_module, mock_dns, metrics_batch):
+        """Test that temporary DNS failures are not cached."""
+        # Clear cache
+        server_module.dns_cache.cache.clear()
+        
+        tempfail = server_module.socket.gaierror(server_module.socket.EAI_AGAIN, 'Temporary failure in name resolution')
+        mock_dns.side_effect = tempfail
+        for _ in range(2):
+            with pytest.raises(server_module.socket.gaierror):
+                server_module.RequestHandler._get_ip_address('flaky.example.com', metrics_batch)
+        
+        assert mock_dns.call_count == 2
+    
+    def test_cache_reset_endpoint(self, mock_request_handler):
+        """Test /cache/reset endpoint."""
+        handler, server = mock_request_handler
+        
+        server.dns_cache.set('test.example.com', '192.168.1.1')
+        
+        handler.path = '/cache/reset'
+        handler.do_GET()
+        
+        assert json.loads(_parse_http_response(handler)[2]) == {'status': 'cache reseted'}
+        assert server.dns_cache.stats()['total_entries'] == 0
+
+
+class TestBoundedThreadingHTTPServer:
+    """Test the worker pool HTTP server."""
+    
+    @pytest.mark.parametrize('workers', ['0', '-1'])
+    def test_invalid_worker_count_exits(self, temp_subnets_file, workers):
+        """Test that the server exits when WORKERS is below 1."""
+        result = _import_server_in_subprocess(temp_subnets_file, WORKERS=workers)
+        assert result.returncode == 1
+        assert f'WORKERS must be at least 1, got {workers}.'.encode() in result.stdout
+
+    @pytest.mark.enable_socket
+    def test_serves_requests_from_worker_pool(self, server_module):
+        """Test that queued connections are handled by the worker threads."""
+        import http.client
+        import threading
+        
+        httpd = server_module.BoundedThreadingHTTPServer(('127.0.0.1', 0), server_module.RequestHandler, max_workers=1)
+        serve_thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        serve_thread.start()
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1], timeout=5)
+            # Two requests on one keep-alive connection
+            for path in ('/healthz', '/ip/192.168.1.1'):
+                connection.request('GET', path)
+                response = connection.getresponse()
+                assert response.status == 200
+                response.read()
+            connection.close()
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+            serve_thread.join()
+
+    @pytest.mark.enable_socket
+    def test_reused_connection_is_not_delayed(self, server_module):
+        """Test that requests on a kept-alive connection are not held back by Nagle's algorithm."""
+        import http.client
+        import threading
+        
+        httpd = server_module.BoundedThreadingHTTPServer(('127.0.0.1', 0), server_module.RequestHandler, max_workers=1)
+        serve_thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        serve_thread.start()
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1], timeout=5)
+            durations = []
+            for _ in range(5):
+                start = time.perf_counter()
+                connection.request('GET', '/healthz')
+                response = connection.getresponse()
+                response.read()
+                durations.append(time.perf_counter() - start)
+                assert response.status == 200
+            connection.close()
+            
+            # A delayed ACK stalls each reused request by ~40ms; allow generous slack below that
+            assert min(durations[1:]) < 0.02
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+            serve_thread.join()
+
+    @pytest.mark.enable_socket
+    def test_idle_keep_alive_connection_does_not_hold_worker(self, server_module):
+        """Test that an idle keep-alive client cannot starve other requests."""
+        import http.client
+        import threading
+        
+        httpd = server_module.BoundedThreadingHTTPServer(('127.0.0.1', 0), server_module.RequestHandler, max_workers=1)
+        serve_thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        serve_thread.start()
+        try:
+            port = httpd.server_address[1]
+            idle = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            idle.request('GET', '/healthz')
+            idle.getresponse().read()
+            
+            # The only worker must be free for a new client while the first one idles
+            probe = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            probe.request('GET', '/healthz')
+            assert probe.getresponse().status == 200
+            probe.close()
+            
+            # The parked connection is still served when it sends its next request
+            idle.request('GET', '/readyz')
+            assert idle.getresponse().status == 200
+            idle.close()
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+            serve_thread.join()
+
+    @pytest.mark.enable_socket
+    def test_silent_connections_do_not_hold_workers(self, server_module):
+        """Test that connections which never send a request cannot starve other requests."""
+        import http.client
+        import threading
+        
+        httpd = server_module.BoundedThreadingHTTPServer(('127.0.0.1', 0), server_module.RequestHandler, max_workers=1)
+        serve_thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        serve_thread.start()
+        silent = []
+        try:
+            port = httpd.server_address[1]
+            silent = [socket.create_connection(('127.0.0.1', port)) for _ in range(2)]
             
-            # Both responses should be successful
-            assert 'eu-central-1b' in response1
-            assert 'eu-central-1b' in response2
+            probe = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            probe.request('GET', '/healthz')
+            assert probe.getresponse().status == 200
+            probe.close()
+        finally:
+            for connection in silent:
+                connection.close()
+            httpd.shutdown()
+            httpd.server_close()
+            serve_thread.join()
+
+    @pytest.mark.enable_socket
+    def test_server_close_waits_for_in_flight_request(self, server_module):
+        """Test that shutting down lets a request that is being handled finish."""
+        import http.client
+        import threading
+        
+        lookup_started = threading.Event()
+        lookup_finished = threading.Event()
+        
+        def slow_lookup(fqdn, metrics):
+            lookup_started.set()
+            time.sleep(0.3)
+            lookup_finished.set()
+            return '192.168.1.1'
+        
+        httpd = server_module.BoundedThreadingHTTPServer(('127.0.0.1', 0), server_module.RequestHandler, max_workers=1)
+        serve_thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+        serve_thread.start()
+        statuses = []
+        
+        def request():
+            connection = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1], timeout=5)
+            connection.request('GET', '/fqdn/slow.example.com')
+            statuses.append(connection.getresponse().status)
+            connection.close()
+        
+        with patch.object(server_module.RequestHandler, '_get_ip_address', side_effect=slow_lookup):
+            client_thread = threading.Thread(target=request)
+            client_thread.start()
+            assert lookup_started.wait(5)
+            httpd.shutdown()
+            httpd.server_close()
+            assert lookup_finished.is_set()
+            serve_thread.join()
+            client_thread.join(5)
+        
+        assert statuses == [200]